@@ -2,6 +2,9 @@ import logging
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import SimpleNamespace
 
 # Azure libraries
 try:
@@ -13,8 +16,27 @@ except ImportError:
     print("Please run: pip install azure-identity azure-mgmt-resource")
     sys.exit(1)
 
+# Optional: Azure Resource Graph answers the whole drift query in one call.
+# Without it we fall back to listing resources through ARM.
+try:
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+except ImportError:
+    ResourceGraphClient = None
+
+# Optional: orjson, used for the report if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging to print to console
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# When running inside AWS Lambda, CloudWatch already timestamps every line, so skip asctime.
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    LOG_FORMAT = '%(levelname)s - %(message)s'
+else:
+    LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 logger = logging.getLogger()
 
 # ### CONFIGURATION ###
@@ -37,6 +59,117 @@ CONFIG = {
 }
 # #####################
 
+# One drifted resource. Large subscriptions can produce thousands of these, so they are
+# slotted records rather than dicts; they are turned into report dicts only when printing.
+@dataclass(slots=True)
+class DriftRecord:
+    resource: str
+    type: str
+    status: str
+    details: str
+
+    def to_report(self):
+        return {
+            "Resource": self.resource,
+            "Type": self.type,
+            "Status": self.status,
+            "Details": self.details
+        }
+
+def build_tag_check(expected_tags):
+    # EXPECTED_TAGS is fixed for the whole scan, so generate a predicate with the checks
+    # inlined, e.g. `return tags.get('Environment') == 'Production'`, instead of looping
+    # over the dict for every resource. Keys and values are embedded with repr().
+    if not expected_tags:
+        return lambda tags: True
+    src = "def check(tags):\n    return " + " and ".join(
+        f"tags.get({key!r}) == {value!r}" for key, value in expected_tags.items()
+    )
+    namespace = {}
+    exec(src, namespace)
+    return namespace["check"]
+
+def check_resource_group(resource_client, rg_name):
+    # Returns (report entries, exists) for one resource group.
+    logger.info("Checking Resource Group: %s", rg_name)
+
+    # Check 1: Does RG exist?
+    try:
+        rg = resource_client.resource_groups.get(rg_name)
+    except ResourceNotFoundError:
+        logger.error("Resource Group '%s' NOT FOUND.", rg_name)
+        return [{"ResourceGroup": rg_name, "Status": "MISSING"}], False
+
+    # Check 2: Provisioning State
+    entries = []
+    if rg.provisioning_state != "Succeeded":
+        entries.append({
+            "ResourceGroup": rg_name,
+            "Status": "UNHEALTHY",
+            "Reason": f"State is {rg.provisioning_state}"
+        })
+    return entries, True
+
+def list_resources_by_rg(resource_client, rg_names):
+    # Lists the subscription's resources once and buckets them by resource group.
+    # One subscription-wide listing instead of one `list_by_resource_group` call per RG.
+    # The resource group is the 5th segment of the resource ID:
+    # /subscriptions/{sub}/resourceGroups/{rg}/providers/...
+    # RG names are case-insensitive in Azure, so we group on the lower-cased name.
+    resources_by_rg = {rg_name.lower(): [] for rg_name in rg_names}
+    if not resources_by_rg:
+        return resources_by_rg
+
+    # Walk the listing page by page (one HTTP call per page) so each page is handled in bulk.
+    for page in resource_client.resources.list().by_page():
+        for resource in page:
+            rg_key = resource.id.split('/')[4].lower()
+            if rg_key in resources_by_rg:
+                resources_by_rg[rg_key].append(resource)
+    return resources_by_rg
+
+def kql_string(value):
+    # Quotes a value as a Kusto string literal
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def query_drifted_resources(graph_client, subscription_id, rg_names, target_region, expected_items):
+    # Asks Azure Resource Graph for just the non-compliant resources in the target RGs,
+    # so the region/tag filtering happens server-side in one query (plus a page per
+    # 1000 results) instead of listing every resource through ARM.
+    # Returns the same {rg name (lower-cased): [resource]} shape as list_resources_by_rg.
+    # Note: Resource Graph is eventually consistent and can lag ARM by a few minutes,
+    # and it returns `type` lower-cased (e.g. microsoft.compute/virtualmachines).
+    resources_by_rg = {rg_name.lower(): [] for rg_name in rg_names}
+    if not resources_by_rg:
+        return resources_by_rg
+
+    noncompliant = [f"location !~ {kql_string(target_region)}"]
+    noncompliant += [
+        f"tostring(tags[{kql_string(key)}]) != {kql_string(value)}"
+        for key, value in expected_items
+    ]
+    query = (
+        "resources"
+        f" | where resourceGroup in~ ({', '.join(kql_string(rg) for rg in rg_names)})"
+        f" | where {' or '.join(noncompliant)}"
+        " | project name, type, location, tags, resourceGroup"
+    )
+
+    skip_token = None
+    while True:
+        response = graph_client.resources(QueryRequest(
+            subscriptions=[subscription_id],
+            query=query,
+            options=QueryRequestOptions(top=1000, skip_token=skip_token)
+        ))
+        for row in response.data:
+            rg_key = row["resourceGroup"].lower()
+            if rg_key in resources_by_rg:
+                resources_by_rg[rg_key].append(SimpleNamespace(**row))
+        skip_token = response.skip_token
+        if not skip_token:
+            return resources_by_rg
+
 def check_azure_drift():
     logger.info('--- Starting Azure Drift Check ---')
 
@@ -46,75 +179,129 @@ def check_azure_drift():
         credential = DefaultAzureCredential()
         subscription_id = CONFIG["SUBSCRIPTION_ID"]
         resource_client = ResourceManagementClient(credential, subscription_id)
+        graph_client = ResourceGraphClient(credential) if ResourceGraphClient is not None else None
     except Exception as e:
-        logger.error(f"Authentication Failed. Run 'az login' in your terminal. Error: {e}")
+        logger.error("Authentication Failed. Run 'az login' in your terminal. Error: %s", e)
         return
 
     drift_report = []
     
     # 2. Iterate through Resource Groups
-    for rg_name in CONFIG["RESOURCE_GROUPS"]:
-        logger.info(f"Checking Resource Group: {rg_name}")
-        
+    # All of these calls are network-bound, so the per-RG checks and the resource
+    # listing run side by side. Total time is roughly the slowest call, not the sum.
+    existing_rgs = []
+    resources_by_rg = {}
+    # Set when part of the scan could not run, so a failure is never reported as IN_SYNC
+    scan_complete = True
+    rg_names = CONFIG["RESOURCE_GROUPS"]
+
+    # The expected region and tags never change during a scan, so look them up once
+    # (as locals) instead of going through CONFIG for every resource.
+    target_region = CONFIG["TARGET_REGION"]
+    expected_items = tuple(CONFIG["EXPECTED_TAGS"].items())
+    tags_compliant = build_tag_check(CONFIG["EXPECTED_TAGS"])
+
+    with ThreadPoolExecutor(max_workers=len(rg_names) + 1) as executor:
+        if graph_client is not None:
+            listing = executor.submit(
+                query_drifted_resources, graph_client, subscription_id, rg_names, target_region, expected_items
+            )
+        else:
+            listing = executor.submit(list_resources_by_rg, resource_client, rg_names)
+        rg_checks = [(rg_name, executor.submit(check_resource_group, resource_client, rg_name)) for rg_name in rg_names]
+
         try:
-            # Check 1: Does RG exist?
-            try:
-                rg = resource_client.resource_groups.get(rg_name)
-            except ResourceNotFoundError:
-                logger.error(f"Resource Group '{rg_name}' NOT FOUND.")
-                drift_report.append({"ResourceGroup": rg_name, "Status": "MISSING"})
-                continue
+            for rg_name, future in rg_checks:
+                try:
+                    entries, exists = future.result()
+                except ClientAuthenticationError:
+                    raise
+                except Exception as e:
+                    logger.error("Unexpected error checking %s: %s", rg_name, e)
+                    scan_complete = False
+                    continue
 
-            # Check 2: Provisioning State
-            if rg.provisioning_state != "Succeeded":
-                 drift_report.append({
-                    "ResourceGroup": rg_name,
-                    "Status": "UNHEALTHY",
-                    "Reason": f"State is {rg.provisioning_state}"
-                })
+                drift_report.extend(entries)
+                if exists:
+                    existing_rgs.append(rg_name)
 
             # Check 3: Resource Drift (Region & Tags)
-            resources = resource_client.resources.list_by_resource_group(rg_name)
-            
-            for resource in resources:
-                resource_drifted = False
-                drift_reasons = []
-
-                # A. Region Check
-                if resource.location != CONFIG["TARGET_REGION"]:
-                    resource_drifted = True
-                    drift_reasons.append(f"Region: {resource.location} (Expected {CONFIG['TARGET_REGION']})")
-
-                # B. Tag Check
-                current_tags = resource.tags or {}
-                for key, value in CONFIG["EXPECTED_TAGS"].items():
-                    if current_tags.get(key) != value:
-                        resource_drifted = True
-                        drift_reasons.append(f"Missing Tag: {key}={value}")
-
-                if resource_drifted:
-                    drift_report.append({
-                        "Resource": resource.name,
-                        "Type": resource.type,
-                        "Status": "DRIFTED",
-                        "Details": ", ".join(drift_reasons)
-                    })
+            try:
+                resources_by_rg = listing.result()
+            except ClientAuthenticationError:
+                raise
+            except Exception as e:
+                if graph_client is None:
+                    logger.error("Unexpected error listing resources: %s", e)
+                    scan_complete = False
+                else:
+                    # Resource Graph may be unavailable (e.g. missing permissions on it);
+                    # fall back to listing every resource through ARM.
+                    logger.warning("Resource Graph query failed, falling back to ARM listing: %s", e)
+                    try:
+                        resources_by_rg = list_resources_by_rg(resource_client, rg_names)
+                    except ClientAuthenticationError:
+                        raise
+                    except Exception as e:
+                        logger.error("Unexpected error listing resources: %s", e)
+                        scan_complete = False
 
         except ClientAuthenticationError:
             logger.error("Authentication rejected. Check your Subscription ID.")
-            break
-        except Exception as e:
-            logger.error(f"Unexpected error checking {rg_name}: {str(e)}")
+            existing_rgs = []
+            scan_complete = False
+
+    resource_drifts = []
+    for rg_name in existing_rgs:
+        for resource in resources_by_rg.get(rg_name.lower(), []):
+            # Untagged resources come back with tags=None; test for that directly rather than
+            # allocating an empty dict for every one of them.
+            tags = resource.tags
+            if tags is None:
+                tags_ok = not expected_items
+            else:
+                tags_ok = tags_compliant(tags)
+
+            # Most resources are compliant: check with a plain boolean first and only
+            # build the list of reasons for resources that actually drifted.
+            if tags_ok and resource.location == target_region:
+                continue
+
+            drift_reasons = []
+
+            # A. Region Check
+            if resource.location != target_region:
+                drift_reasons.append(f"Region: {resource.location} (Expected {target_region})")
+
+            # B. Tag Check
+            if tags is None:
+                if expected_items:
+                    drift_reasons.append("Missing all required tags")
+            elif not tags_ok:
+                for key, value in expected_items:
+                    if tags.get(key) != value:
+                        drift_reasons.append(f"Missing Tag: {key}={value}")
+
+            resource_drifts.append(DriftRecord(
+                resource.name, resource.type, "DRIFTED", ", ".join(drift_reasons)
+            ))
 
     # 3. Report Results
-    if drift_report:
+    if drift_report or resource_drifts:
+        drift_report.extend(record.to_report() for record in resource_drifts)
         print("\n" + "="*30)
         print("DRIFT DETECTED REPORT")
         print("="*30)
-        print(json.dumps(drift_report, indent=2))
-    else:
+        if orjson is not None:
+            print(orjson.dumps(drift_report, option=orjson.OPT_INDENT_2).decode('utf-8'))
+        else:
+            print(json.dumps(drift_report, indent=2))
+    elif scan_complete:
         print("\n All checked resources are IN_SYNC and Compliant.")
 
+    if not scan_complete:
+        print("\n Scan INCOMPLETE: some checks could not run (see errors above). Results may not show all drift.")
+
 # This block allows you to run it locally
 if __name__ == "__main__":
     check_azure_drift()
@@ -1,9 +1,26 @@
 import boto3
 import json
 import logging
+import os
+import random
+import statistics
+import threading
 import time
+from botocore.config import Config
+from botocore.exceptions import WaiterError
+from botocore.waiter import WaiterModel, create_waiter_with_client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+# Optional: faster JSON serialization if orjson is in the Lambda layer
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
+# Log calls use lazy %-style arguments so the message is only built when the record is
+# actually emitted.
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -16,129 +33,569 @@ CONFIG = {
         "arn:aws:cloudformation:ap-south-1:471112828084:stack/DynamoDB/eac28c70-f209-11ee-8b09-0a02e01a9aa3",
         "arn:aws:cloudformation:ap-south-1:471112828084:stack/EC2instance/74c0e490-f209-11ee-a0af-0aac48631e59",
         "arn:aws:cloudformation:ap-south-1:471112828084:stack/S3Bucket/edefa5f0-f208-11ee-bd3f-06859283fa06"
-    ]
+    ],
+    # Bucket that receives full drift details when they are too large for an SNS message.
+    # Replace with a bucket you own; while it is left as the placeholder, nothing is uploaded.
+    "REPORT_BUCKET": "YOUR-REPORT-BUCKET-HERE",
+    # Account that must own REPORT_BUCKET (checked by S3 on every upload)
+    "REPORT_BUCKET_OWNER": "471112828084"
 }
 
-def lambda_handler(event, context):
-    cf_client = boto3.client('cloudformation')
-    sns_client = boto3.client('sns')
 
+def _clean_stack_name(stack_id):
+    # arn:aws:cloudformation:<region>:<account>:stack/<name>/<uuid> -> <name>
+    # Plain stack names, and ARNs without a /-separated resource part, are returned unchanged
+    # so one malformed CONFIG entry can't stop the module from loading.
+    if stack_id.startswith('arn:'):
+        resource_parts = stack_id.split(':', 5)[-1].split('/')
+        if len(resource_parts) > 1:
+            return resource_parts[1]
+    return stack_id
+
+
+# (stack ARN, short stack name) pairs, parsed once at load time instead of per invocation
+STACKS = [(arn, _clean_stack_name(arn)) for arn in CONFIG['STACK_ARNS']]
+
+# Short stack name for each configured stack, keyed by both the CONFIG entry and its short
+# name, so drift events (which carry the full stack ARN) also match stacks listed by name.
+MONITORED_STACKS = {key: name for stack_id, name in STACKS for key in (stack_id, name)}
+
+# Stack statuses in which CloudFormation accepts a drift detection request
+DETECTABLE_STACK_STATUSES = {
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'UPDATE_ROLLBACK_FAILED',
+    'IMPORT_COMPLETE'
+}
+
+# SNS PublishBatch accepts at most 10 entries per call, and the whole batch
+# (like a single message) must fit in 256 KB.
+SNS_BATCH_SIZE = 10
+SNS_MAX_PAYLOAD_BYTES = 256 * 1024
+
+# describe_stack_resource_drifts returns at most 100 results per call
+DRIFTS_PAGE_SIZE = 100
+
+# Drift details larger than this are uploaded to S3 instead of being inlined in the email
+DRIFT_DETAILS_INLINE_LIMIT = 200_000
+REPORT_BUCKET_PLACEHOLDER = "YOUR-REPORT-BUCKET-HERE"
+# Requested lifetime of the presigned report link. The link is signed with the Lambda role's
+# temporary credentials and stops working when they expire, usually within a few hours, so
+# the message also carries the permanent s3:// location of the report.
+REPORT_URL_EXPIRY = 12 * 3600
+
+# ### [ADDED] Client Caching
+# Building a client loads its service model and endpoint/signing machinery, which costs
+# tens of milliseconds. Clients created at module load are reused by every warm invocation.
+# All clients are built on the main thread while the module loads, because a Session
+# must not be shared across threads.
+_SESSION = boto3.session.Session()
+SNS_CLIENT = _SESSION.client('sns')
+S3_CLIENT = _SESSION.client('s3')
+
+# Maximum number of stacks checked at the same time
+MAX_WORKERS = 32
+
+# ### [ADDED] Throttling Protection
+# CloudFormation's drift APIs have low per-account TPS limits, and the worker threads call
+# them concurrently. Adaptive retry mode rate-limits requests client-side whenever
+# CloudFormation starts throttling. Its token bucket belongs to the client, so every worker
+# shares the one CF_CLIENT below (low-level clients are thread-safe; only Sessions are
+# not). The default pool of 10 connections would make the extra workers queue for a socket,
+# so the pool is sized to match MAX_WORKERS.
+CF_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    max_pool_connections=MAX_WORKERS
+)
+CF_CLIENT = _SESSION.client('cloudformation', config=CF_CONFIG)
+
+
+# ### [ADDED] Drift Detection Waiter
+# botocore ships waiters for stack create/update/delete but not for drift detection, so we
+# describe one here in botocore's own waiter format and let it drive the polling.
+DRIFT_WAITER_MODEL = WaiterModel({
+    "version": 2,
+    "waiters": {
+        "StackDriftDetectionComplete": {
+            "operation": "DescribeStackDriftDetectionStatus",
+            "delay": 5,
+            "maxAttempts": 60,
+            "acceptors": [
+                {"state": "success", "matcher": "path", "argument": "DetectionStatus", "expected": "DETECTION_COMPLETE"},
+                {"state": "failure", "matcher": "path", "argument": "DetectionStatus", "expected": "DETECTION_FAILED"}
+            ]
+        }
+    }
+})
+
+# ### [ADDED] Adaptive First Poll
+# A fixed polling delay is too eager for stacks that always take ~30s and too slow for
+# stacks that finish in a few seconds. We keep the last few detection times per stack in
+# /tmp (it survives between warm Lambda invocations) and hold off the first poll until
+# shortly before the stack usually finishes. The jitter stops parallel workers from
+# polling CloudFormation in lockstep.
+TIMINGS_CACHE_PATH = os.path.join('/tmp', 'drift_detection_timings.json')
+TIMINGS_SAMPLES = 5
+_timings_lock = threading.Lock()
+
+
+def _load_timings():
+    try:
+        with open(TIMINGS_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _initial_poll_delay(stack_name):
+    with _timings_lock:
+        samples = _load_timings().get(stack_name)
+    if not samples:
+        return 0
+    return min(30, 0.8 * statistics.median(samples)) + random.uniform(0, 0.5)
+
+
+def _record_detection_time(stack_name, seconds):
+    with _timings_lock:
+        timings = _load_timings()
+        timings[stack_name] = (timings.get(stack_name, []) + [round(seconds, 1)])[-TIMINGS_SAMPLES:]
+        try:
+            with open(TIMINGS_CACHE_PATH, 'w') as f:
+                json.dump(timings, f)
+        except OSError as e:
+            logger.warning("Could not update drift timing cache: %s", e)
+
+def _process_stack(stack_name, clean_stack_name):
+    # ### [ADDED] Per-stack worker
+    # Runs _check_stack() on a worker thread. All workers share CF_CLIENT so they also
+    # share its adaptive rate limiter.
+    return _check_stack(CF_CLIENT, stack_name, clean_stack_name)
+
+
+def _check_stack(cf_client, stack_name, clean_stack_name):
+    # The body of the old `for stack_name in stack_names` loop. Returns
+    # (clean_stack_name, drift_details, stack_drift_status); stack_drift_status is None
+    # if detection failed or timed out.
+
+    logger.info("--- Processing stack: %s ---", stack_name)
+
+    # Step 1: Trigger Drift Detection
+    detect_resp = cf_client.detect_stack_drift(StackName=stack_name)
+    started = time.monotonic()
+    drift_detection_id = detect_resp['StackDriftDetectionId']
+    
+    logger.info("Drift detection initiated. ID: %s", drift_detection_id)
+
+    # ### [FIXED] Polling Logic (Replaced hard sleep)
+    # The original script used `time.sleep(30)` which wastes time if the check finishes in 2 seconds.
+    # Polling is now handed to a botocore waiter (see DRIFT_WAITER_MODEL), which owns the
+    # delay/max-attempts loop and raises WaiterError on timeout or DETECTION_FAILED.
+    initial_delay = _initial_poll_delay(stack_name)
+    if initial_delay:
+        logger.info("Waiting %.1fs before first poll for stack: %s", initial_delay, stack_name)
+        time.sleep(initial_delay)
+
+    waiter = create_waiter_with_client(
+        'StackDriftDetectionComplete', DRIFT_WAITER_MODEL, cf_client
+    )
+    try:
+        waiter.wait(
+            StackDriftDetectionId=drift_detection_id,
+            WaiterConfig={'Delay': 5, 'MaxAttempts': 60}
+        )
+    except WaiterError as e:
+        reason = (e.last_response or {}).get('DetectionStatusReason', str(e))
+        logger.error("Drift detection did not complete for stack %s: %s", stack_name, reason)
+        return clean_stack_name, [], None
+
+    _record_detection_time(stack_name, time.monotonic() - started)
+
+    # ### [FIXED] Logic Bug
+    # Originally, you were overwriting `drift_status` repeatedly. 
+    # I separated `detection_status` (is the check done?) from `stack_drift_status` (did it drift?).
+    status_resp = cf_client.describe_stack_drift_detection_status(
+        StackDriftDetectionId=drift_detection_id
+    )
+    stack_drift_status = status_resp['StackDriftStatus']
+    logger.info("Detection complete. Stack Status: %s", stack_drift_status)
+
+    # Step 3: Fetch Drift Details
+    # ### [ADDED] Optimization
+    # We only fetch resource details if the stack actually shows 'DRIFTED'.
+    # If it is 'IN_SYNC', there is no need to query for resource details.
+    drift_details = []
+    if stack_drift_status == 'DRIFTED':
+        drift_details = _fetch_drift_details(cf_client, stack_name)
+
+    return clean_stack_name, drift_details, stack_drift_status
+
+
+def _fetch_drift_details(cf_client, stack_name):
+    # ### [ADDED] Pagination Support
+    # The original script missed resources if a stack had many items (AWS returns results in pages).
+    # botocore has no paginator for this operation, so we follow NextToken ourselves and
+    # ask for the largest page the API allows to keep the number of round-trips down.
+    # ### [IMPROVED] Filtering
+    # I added `StackResourceDriftStatusFilters`. We only care about MODIFIED or DELETED items.
+    drift_details = []
+    for page in _resource_drift_pages(cf_client, stack_name):
+        for drift in page['StackResourceDrifts']:
+            drift_details.append({
+                'Resource': drift['LogicalResourceId'],
+                'Type': drift['ResourceType'],
+                'Status': drift['StackResourceDriftStatus'],
+                # ### [ADDED] Safe Access
+                # Used .get() to avoid crashes if expected/actual properties are missing
+                'Expected': drift.get('ExpectedProperties', 'N/A'),
+                'Actual': drift.get('ActualProperties', 'N/A')
+            })
+    return drift_details
+
+
+def _resource_drift_pages(cf_client, stack_name):
+    # Yields describe_stack_resource_drifts pages for the MODIFIED/DELETED resources of a stack.
+    # NextToken makes the pages strictly sequential, so they cannot be fetched in parallel.
+    params = {
+        'StackName': stack_name,
+        'StackResourceDriftStatusFilters': ['MODIFIED', 'DELETED'],
+        'MaxResults': DRIFTS_PAGE_SIZE
+    }
+    while True:
+        page = cf_client.describe_stack_resource_drifts(**params)
+        yield page
+        if not page.get('NextToken'):
+            return
+        params['NextToken'] = page['NextToken']
+
+
+def _to_json(obj, pretty=True):
+    # Indented output is for humans (the email body); compact output is for machines (S3).
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0, default=str).decode('utf-8')
+    if pretty:
+        return json.dumps(obj, indent=2, default=str)
+    return json.dumps(obj, separators=(',', ':'), default=str)
+
+
+def _utf8_size(text):
+    # ASCII text is one byte per character, which saves encoding a copy just to measure it
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+def _batch_notifications(notifications):
+    # Groups notifications into batches of at most SNS_BATCH_SIZE entries whose combined
+    # size stays under SNS_MAX_PAYLOAD_BYTES. Sizes come precomputed from _build_notification.
+    batch, batch_size = [], 0
+    for notification in notifications:
+        size = notification['Size']
+        if batch and (len(batch) == SNS_BATCH_SIZE or batch_size + size > SNS_MAX_PAYLOAD_BYTES):
+            yield batch
+            batch, batch_size = [], 0
+        batch.append(notification)
+        batch_size += size
+    if batch:
+        yield batch
+
+
+def _offload_drift_details(s3_client, bucket, bucket_owner, clean_stack_name, details_json):
+    # ### [ADDED] S3 Offload
+    # Uploads the full drift details (including the expected/actual property blobs) and
+    # returns (s3:// location, presigned link) for the notification. ExpectedBucketOwner makes
+    # S3 reject the upload if the bucket belongs to any other account.
+    key = f"{clean_stack_name}/{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=details_json.encode('utf-8'),
+        ContentType='application/json',
+        ExpectedBucketOwner=bucket_owner
+    )
+    report_url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': key},
+        ExpiresIn=REPORT_URL_EXPIRY
+    )
+    return f"s3://{bucket}/{key}", report_url
+
+
+def _publish_notifications(sns_client, sns_topic_arn, notifications):
+    # ### [ADDED] Batched Notifications
+    # Instead of one `publish` round-trip per drifted stack, send up to 10 messages per
+    # `publish_batch` call. SNS reports each message individually, so entries that failed
+    # on the AWS side are retried once after a short backoff; sender faults are only logged.
+    for chunk in _batch_notifications(notifications):
+        entries = [
+            {'Id': str(i), 'Subject': n['Subject'], 'Message': n['Message']}
+            for i, n in enumerate(chunk)
+        ]
+
+        for attempt in range(2):
+            response = sns_client.publish_batch(
+                TopicArn=sns_topic_arn,
+                PublishBatchRequestEntries=entries
+            )
+            failed = response.get('Failed', [])
+            retry_ids = set()
+            for failure in failed:
+                subject = chunk[int(failure['Id'])]['Subject']
+                if attempt == 0 and not failure.get('SenderFault'):
+                    retry_ids.add(failure['Id'])
+                else:
+                    logger.error("Failed to publish '%s': %s %s", subject, failure.get('Code'), failure.get('Message', ''))
+
+            if not retry_ids:
+                break
+            entries = [e for e in entries if e['Id'] in retry_ids]
+            time.sleep(2 ** attempt + random.uniform(0, 0.5))
+
+
+def _filter_detectable_stacks(cf_client, stacks):
+    # ### [ADDED] Up-front Stack Validation
+    # detect_stack_drift on a missing or mid-update stack only fails after CloudFormation has
+    # scheduled it, so we check every configured stack with one describe_stacks pass first.
+    # Returns (stacks to check, {stack ARN: reason skipped}).
+    known = {}
+    for page in cf_client.get_paginator('describe_stacks').paginate():
+        for stack in page['Stacks']:
+            known[stack['StackId']] = stack
+            known[stack['StackName']] = stack
+
+    detectable, skipped = [], {}
+    for stack_name, clean_stack_name in stacks:
+        stack = known.get(stack_name)
+        if stack is None:
+            logger.warning("Skipping stack %s: not found", stack_name)
+            skipped[stack_name] = 'NOT_FOUND'
+        elif stack['StackStatus'] not in DETECTABLE_STACK_STATUSES:
+            logger.warning("Skipping stack %s: status %s does not allow drift detection", stack_name, stack['StackStatus'])
+            skipped[stack_name] = f"SKIPPED ({stack['StackStatus']})"
+        else:
+            detectable.append((stack_name, clean_stack_name))
+    return detectable, skipped
+
+
+def _build_notification(clean_stack_name, drift_details, stack_drift_status, report_bucket):
+    # Returns the SNS notification for a drifted stack, or None if there is nothing to send.
+    # I added a check so we ONLY send an SNS email if Drift is detected.
+    # This prevents "Everything is fine" spam emails.
+    if stack_drift_status != 'DRIFTED':
+        logger.info("Stack %s is IN_SYNC. No notification sent.", clean_stack_name)
+        return None
+
+    details_json = _to_json(drift_details)
+
+    # ### [ADDED] Payload Size Guard
+    # ExpectedProperties/ActualProperties can be several KB per resource, which quickly
+    # pushes a message past SNS's 256 KB limit. Large reports go to S3 and the email
+    # carries a per-resource summary plus a link to the full details.
+    report_link = ""
+    details_size = _utf8_size(details_json)
+    if details_size > DRIFT_DETAILS_INLINE_LIMIT:
+        summary = [
+            {'Resource': d['Resource'], 'Type': d['Type'], 'Status': d['Status']}
+            for d in drift_details
+        ]
+        details_json = _to_json(summary)
+        details_size = _utf8_size(details_json)
+        if not report_bucket or report_bucket == REPORT_BUCKET_PLACEHOLDER:
+            logger.warning("Drift details for stack %s are too large to inline and REPORT_BUCKET is not set", clean_stack_name)
+            report_link = "\n\nFull drift details were too large to include (no REPORT_BUCKET configured)."
+        else:
+            try:
+                report_location, report_url = _offload_drift_details(
+                    S3_CLIENT, report_bucket, CONFIG['REPORT_BUCKET_OWNER'], clean_stack_name,
+                    _to_json(drift_details, pretty=False)
+                )
+                report_link = (
+                    f"\n\nFull drift details: {report_location}"
+                    f"\nTemporary download link (expires within a few hours): {report_url}"
+                )
+            except Exception as e:
+                logger.error("Error uploading drift details for stack %s: %s", clean_stack_name, e)
+                report_link = "\n\nFull drift details were too large to include and could not be uploaded to S3."
+
+    # Assembled with a single join so the (possibly large) JSON body is copied once.
+    # The byte size is added up from the parts here, where the JSON body has already been
+    # measured, so batching never has to scan or encode the finished message.
+    subject = f"Drift Report: {clean_stack_name} [DRIFTED]"
+    header = ''.join([
+        "⚠️ DRIFT DETECTED\n\n",
+        "Stack: ", clean_stack_name, "\n",
+        "Status: ", stack_drift_status, "\n\n",
+        "Drifted Resources (", str(len(drift_details)), "):\n"
+    ])
+    message_body = ''.join([header, details_json, report_link])
+    return {
+        'Subject': subject,
+        'Message': message_body,
+        'Size': _utf8_size(subject) + _utf8_size(header) + details_size + _utf8_size(report_link)
+    }
+
+
+def _flush_notifications(sns_topic_arn, notifications):
+    try:
+        _publish_notifications(SNS_CLIENT, sns_topic_arn, notifications)
+    except Exception as e:
+        logger.error("Error publishing drift notifications: %s", e)
+
+
+def lambda_handler(event, context):
     # Load config from the dictionary above
-    stack_names = CONFIG['STACK_ARNS']
+    stacks = STACKS
     sns_topic_arn = CONFIG['SNS_TOPIC_ARN']
+    report_bucket = CONFIG['REPORT_BUCKET']
     
     results = []
+    if not stacks:
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"Process complete. Results: {results}")
+        }
 
-    # ### [ADDED] Loop Error Handling
-    # I added a try-except block inside the loop. In the original script, if one stack 
-    # failed (e.g., permissions error), the whole script crashed. Now it skips to the next stack.
-    for stack_name in stack_names:
-        try:
-            logger.info(f"--- Processing stack: {stack_name} ---")
-
-            # Step 1: Trigger Drift Detection
-            detect_resp = cf_client.detect_stack_drift(StackName=stack_name)
-            drift_detection_id = detect_resp['StackDriftDetectionId']
-            
-            logger.info(f"Drift detection initiated. ID: {drift_detection_id}")
-
-            # ### [FIXED] Polling Logic (Replaced hard sleep)
-            # The original script used `time.sleep(30)` which wastes time if the check finishes in 2 seconds.
-            # I replaced it with a loop that checks status every 2 seconds.
-            stack_drift_status = None
-            detection_status = None
-            
-            max_retries = 20
-            for attempt in range(max_retries):
-                status_resp = cf_client.describe_stack_drift_detection_status(
-                    StackDriftDetectionId=drift_detection_id
-                )
-                detection_status = status_resp['DetectionStatus']
-                
-                # ### [FIXED] Logic Bug
-                # Originally, you were overwriting `drift_status` repeatedly. 
-                # I separated `detection_status` (is the check done?) from `stack_drift_status` (did it drift?).
-                if detection_status == 'DETECTION_COMPLETE':
-                    stack_drift_status = status_resp['StackDriftStatus']
-                    logger.info(f"Detection complete. Stack Status: {stack_drift_status}")
-                    break
-                elif detection_status == 'DETECTION_FAILED':
-                    logger.error(f"Detection failed for stack {stack_name}: {status_resp.get('DetectionStatusReason')}")
-                    break
-                
-                time.sleep(2) 
-            else:
-                # If loop finishes without breaking, it timed out
-                logger.warning(f"Timeout waiting for drift detection on stack: {stack_name}")
-                continue 
-
-            if detection_status != 'DETECTION_COMPLETE':
-                continue
+    skipped = {}
+    try:
+        stacks, skipped = _filter_detectable_stacks(CF_CLIENT, STACKS)
+    except Exception as e:
+        # Don't let a failed pre-check (e.g. missing cloudformation:DescribeStacks permission)
+        # stop the drift checks themselves.
+        logger.warning("Could not validate stacks up front, checking all of them: %s", e)
 
-            # Step 3: Fetch Drift Details
-            drift_details = []
-            
-            # ### [ADDED] Optimization
-            # We only fetch resource details if the stack actually shows 'DRIFTED'.
-            # If it is 'IN_SYNC', there is no need to query for resource details.
-            if stack_drift_status == 'DRIFTED':
-                
-                # ### [ADDED] Pagination Support
-                # The original script missed resources if a stack had many items (AWS returns results in pages).
-                # I added a Paginator to ensure we catch every single drifted resource.
-                paginator = cf_client.get_paginator('describe_stack_resource_drifts')
-                
-                # ### [IMPROVED] Filtering
-                # I added `StackResourceDriftStatusFilters`. We only care about MODIFIED or DELETED items.
-                page_iterator = paginator.paginate(
-                    StackName=stack_name,
-                    StackResourceDriftStatusFilters=['MODIFIED', 'DELETED']
-                )
+    # ### [ADDED] Parallel Drift Detection
+    # Each stack spends almost all of its time waiting on CloudFormation API calls, so the
+    # stacks are now checked concurrently. Total runtime is roughly the slowest stack
+    # instead of the sum of all of them.
+    outcomes = {}
+    pending_notifications = []
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(stacks)))) as executor:
+        futures = {
+            executor.submit(_process_stack, stack_name, clean_stack_name): stack_name
+            for stack_name, clean_stack_name in stacks
+        }
+
+        # ### [ADDED] Loop Error Handling
+        # In the original script, if one stack failed (e.g., permissions error), the whole
+        # script crashed. Now the error is logged and the other stacks carry on.
+        for future in as_completed(futures):
+            stack_name = futures[future]
+            try:
+                outcomes[stack_name] = future.result()
+            except Exception as e:
+                logger.error("Error processing stack %s: %s", stack_name, e)
+                continue
 
-                for page in page_iterator:
-                    for drift in page['StackResourceDrifts']:
-                        drift_details.append({
-                            'Resource': drift['LogicalResourceId'],
-                            'Type': drift['ResourceType'],
-                            'Status': drift['StackResourceDriftStatus'],
-                            # ### [ADDED] Safe Access
-                            # Used .get() to avoid crashes if expected/actual properties are missing
-                            'Expected': drift.get('ExpectedProperties', 'N/A'),
-                            'Actual': drift.get('ActualProperties', 'N/A')
-                        })
-
-            # Step 4: Prepare Notification
-            # Clean stack name (removes the long ARN path)
-            clean_stack_name = stack_name.split('/')[-2] if '/' in stack_name else stack_name
-            
             # ### [MODIFIED] Notification Logic
-            # I added a check so we ONLY send an SNS email if Drift is detected.
-            # This prevents "Everything is fine" spam emails.
-            if stack_drift_status == 'DRIFTED':
-                message_body = (
-                    f"⚠️ DRIFT DETECTED\n\n"
-                    f"Stack: {clean_stack_name}\n"
-                    f"Status: {stack_drift_status}\n\n"
-                    f"Drifted Resources ({len(drift_details)}):\n"
-                    f"{json.dumps(drift_details, indent=2, default=str)}"
-                )
-                
-                sns_client.publish(
-                    TopicArn=sns_topic_arn,
-                    Message=message_body,
-                    Subject=f"Drift Report: {clean_stack_name} [DRIFTED]"
-                )
-            else:
-                logger.info(f"Stack {clean_stack_name} is IN_SYNC. No notification sent.")
-            
-            results.append(f"{clean_stack_name}: {stack_drift_status}")
+            # Each stack's notification (including any S3 upload) is prepared as soon as that
+            # stack finishes, while the workers are still busy with the rest, and a full batch
+            # is published straight away. Only this main thread touches SNS_CLIENT and S3_CLIENT.
+            clean_stack_name, drift_details, stack_drift_status = outcomes[stack_name]
 
-        except Exception as e:
-            # Catches unexpected errors for this specific stack so the loop can continue to the next one
-            logger.error(f"Error processing stack {stack_name}: {str(e)}")
-            continue
+            # Detection failed or timed out; the worker already logged why.
+            if stack_drift_status is None:
+                continue
+
+            notification = _build_notification(clean_stack_name, drift_details, stack_drift_status, report_bucket)
+            if notification is not None:
+                pending_notifications.append(notification)
+                if len(pending_notifications) == SNS_BATCH_SIZE:
+                    _flush_notifications(sns_topic_arn, pending_notifications)
+                    pending_notifications = []
+
+    if pending_notifications:
+        _flush_notifications(sns_topic_arn, pending_notifications)
+
+    # Stacks are reported in CONFIG order.
+    for stack_name, clean_stack_name in STACKS:
+        if stack_name in skipped:
+            results.append(f"{clean_stack_name}: {skipped[stack_name]}")
+        elif stack_name in outcomes and outcomes[stack_name][2] is not None:
+            results.append(f"{clean_stack_name}: {outcomes[stack_name][2]}")
 
     return {
         'statusCode': 200,
         'body': json.dumps(f"Process complete. Results: {results}")
     }
+
+
+# ### [ADDED] Event-Driven Mode
+# lambda_handler above starts drift detection and then polls until every stack finishes.
+# CloudFormation also publishes a "CloudFormation Drift Detection Status Change" event to
+# EventBridge when a detection finishes, so polling can be skipped entirely:
+#   1. initiate_drift_detection: run on the schedule. It only calls detect_stack_drift
+#      for each stack and returns.
+#   2. handle_drift_event: attach to an EventBridge rule with the pattern
+#      {"source": ["aws.cloudformation"],
+#       "detail-type": ["CloudFormation Drift Detection Status Change"]}
+#      It reads the result from the event, then fetches resource drifts and notifies.
+# Deploy either lambda_handler on its own, or these two together.
+
+def initiate_drift_detection(event, context):
+    stacks = STACKS
+    skipped = {}
+    try:
+        stacks, skipped = _filter_detectable_stacks(CF_CLIENT, STACKS)
+    except Exception as e:
+        logger.warning("Could not validate stacks up front, checking all of them: %s", e)
+
+    results = [f"{clean_stack_name}: {skipped[stack_name]}" for stack_name, clean_stack_name in STACKS if stack_name in skipped]
+    for stack_name, clean_stack_name in stacks:
+        try:
+            detect_resp = CF_CLIENT.detect_stack_drift(StackName=stack_name)
+            logger.info("Drift detection initiated for stack %s. ID: %s", stack_name, detect_resp['StackDriftDetectionId'])
+            results.append(f"{clean_stack_name}: DETECTION_IN_PROGRESS")
+        except Exception as e:
+            logger.error("Error starting drift detection for stack %s: %s", stack_name, e)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"Drift detection started. Results: {results}")
+    }
+
+
+def handle_drift_event(event, context):
+    detail = event.get('detail', {})
+    stack_id = detail.get('stack-id')
+    clean_stack_name = None
+    if stack_id:
+        clean_stack_name = MONITORED_STACKS.get(stack_id) or MONITORED_STACKS.get(_clean_stack_name(stack_id))
+
+    # The rule matches drift events for every stack in the account; we only report on ours.
+    if clean_stack_name is None:
+        logger.info("Ignoring drift event for unmonitored stack: %s", stack_id)
+        return {'statusCode': 200, 'body': json.dumps("Stack not monitored.")}
+
+    # CloudFormation nests the result under "status-details"; flat keys are accepted too.
+    status_details = detail.get('status-details', detail)
+    detection_status = status_details.get('detection-status')
+    stack_drift_status = status_details.get('stack-drift-status')
+
+    # Fall back to a single describe call if the event came without a result.
+    if stack_drift_status is None and detail.get('stack-drift-detection-id'):
+        status_resp = CF_CLIENT.describe_stack_drift_detection_status(
+            StackDriftDetectionId=detail['stack-drift-detection-id']
+        )
+        detection_status = status_resp['DetectionStatus']
+        stack_drift_status = status_resp.get('StackDriftStatus')
+
+    if detection_status == 'DETECTION_FAILED' or stack_drift_status is None:
+        logger.error("Drift detection did not complete for stack %s: %s", stack_id, detection_status)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"{clean_stack_name}: {detection_status}")
+        }
+
+    logger.info("Detection complete. Stack Status: %s", stack_drift_status)
+    drift_details = []
+    if stack_drift_status == 'DRIFTED':
+        drift_details = _fetch_drift_details(CF_CLIENT, stack_id)
+
+    notification = _build_notification(
+        clean_stack_name, drift_details, stack_drift_status, CONFIG['REPORT_BUCKET']
+    )
+    if notification is not None:
+        _flush_notifications(CONFIG['SNS_TOPIC_ARN'], [notification])
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"{clean_stack_name}: {stack_drift_status}")
+    }